@@ -24,9 +24,16 @@ import os
 import sys
 import cv2
 import argparse
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import insightface
 from insightface.app import FaceAnalysis
 from insightface.model_zoo import get_model
+from insightface.utils import face_align
+
+# Number of source embeddings kept in memory (keyed by path + mtime)
+EMBEDDING_CACHE_SIZE = 64
 
 
 class FaceSwapPipeline:
@@ -36,9 +43,15 @@ class FaceSwapPipeline:
         print("===========================================")
 
         ctx_id = 0 if use_gpu else -1
-
-        # Load detection + recognition model
-        self.app = FaceAnalysis(name='buffalo_l')
+        providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if use_gpu else ['CPUExecutionProvider']
+
+        # Load detection + recognition model only: swap() uses just .kps and
+        # .normed_embedding, so skip buffalo_l's genderage and landmark models
+        self.app = FaceAnalysis(
+            name='buffalo_l',
+            allowed_modules=['detection', 'recognition'],
+            providers=providers
+        )
         self.app.prepare(ctx_id=ctx_id, det_size=(640, 640))
 
         # Load InSwapper model
@@ -46,20 +59,143 @@ class FaceSwapPipeline:
         self.swapper = get_model(
             model_path,
             download=False,
-            download_zip=False
+            download_zip=False,
+            providers=providers
         )
 
+        self._embedding_cache = OrderedDict()
+
         print("Models loaded successfully.\n")
 
-    def swap(self, source_path, target_path, output_path):
-        print("Reading images...")
+    def source_embedding(self, source_path):
+        """
+        normed_embedding of the first face in the source image, memoized by
+        (path, mtime) so a reused selfie is only detected/embedded once.
+        Returns None if the image can't be read or has no face.
+        """
+        try:
+            key = (os.path.abspath(source_path), os.path.getmtime(source_path))
+        except OSError:
+            print("Cannot load source image.")
+            return None
 
-        src_img = cv2.imread(source_path)
-        tgt_img = cv2.imread(target_path)
+        embedding = self._embedding_cache.get(key)
+        if embedding is not None:
+            self._embedding_cache.move_to_end(key)
+            return embedding
 
+        src_img = cv2.imread(source_path)
         if src_img is None:
             print("Cannot load source image.")
-            return False
+            return None
+
+        src_faces = self.app.get(src_img)
+        if len(src_faces) == 0:
+            print("No face detected in source image.")
+            return None
+
+        print(f"Source faces detected: {len(src_faces)}")
+
+        # Use first source face
+        embedding = src_faces[0].normed_embedding
+        embedding.setflags(write=False)
+        self._embedding_cache[key] = embedding
+        if len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+            self._embedding_cache.popitem(last=False)
+        return embedding
+
+    def _swap_faces(self, img, tgt_faces, src_embedding):
+        """
+        Batched INSwapper.get(..., paste_back=False) over all target faces.
+        Returns a list of (bgr_fake, M) per face.
+        """
+        swapper = self.swapper
+        session = swapper.session
+        n = len(tgt_faces)
+
+        # Align every target face, then build one (N,3,128,128) blob
+        crops, mats = zip(*(face_align.norm_crop2(img, f.kps, swapper.input_size[0]) for f in tgt_faces))
+        mean = swapper.input_mean
+        blob = cv2.dnn.blobFromImages(list(crops), 1.0 / swapper.input_std, swapper.input_size,
+                                      (mean, mean, mean), swapRB=True)
+
+        latent = src_embedding.reshape((1, -1))
+        latent = np.dot(latent, swapper.emap)
+        latent /= np.linalg.norm(latent)
+
+        feed_names = swapper.input_names
+        batch_dim = session.get_inputs()[0].shape[0]
+        if isinstance(batch_dim, int) and n > 1:
+            # Static batch=1 export: one run per face. On CUDA, overlapping two runs
+            # on the shared session keeps the GPU busy; on CPU each run already uses
+            # the full intra-op pool, so run them back to back.
+            def run_one(i):
+                return session.run(swapper.output_names, {feed_names[0]: blob[i:i + 1], feed_names[1]: latent})[0]
+
+            if 'CUDAExecutionProvider' in session.get_providers():
+                with ThreadPoolExecutor(max_workers=min(n, 2)) as ex:
+                    pred = np.concatenate(list(ex.map(run_one, range(n))))
+            else:
+                pred = np.concatenate([run_one(i) for i in range(n)])
+        else:
+            pred = session.run(swapper.output_names, {
+                feed_names[0]: blob,
+                feed_names[1]: np.tile(latent, (n, 1))
+            })[0]
+
+        fakes = np.clip(255 * pred.transpose((0, 2, 3, 1)), 0, 255).astype(np.uint8)[..., ::-1]
+        return list(zip(fakes, mats))
+
+    def _paste_back(self, img, bgr_fake, M):
+        """
+        InsightFace INSwapper paste-back (eroded + blurred square mask blend),
+        written into img in place and computed only over the face's bounding box.
+        """
+        h, w = img.shape[:2]
+        size = bgr_fake.shape[0]
+        IM = cv2.invertAffineTransform(M)
+
+        # Bounding box of the warped crop, padded past the erode/blur reach and clipped to the frame
+        corners = np.array([[0, 0, 1], [size, 0, 1], [0, size, 1], [size, size, 1]], dtype=np.float64) @ IM.T
+        (bx0, by0), (bx1, by1) = corners.min(axis=0), corners.max(axis=0)
+        pad = int(max(bx1 - bx0, by1 - by0)) // 4 + 16
+        x0, y0 = max(int(bx0) - pad, 0), max(int(by0) - pad, 0)
+        x1, y1 = min(int(np.ceil(bx1)) + pad, w), min(int(np.ceil(by1)) + pad, h)
+        if x1 <= x0 or y1 <= y0:
+            return img
+        roi = img[y0:y1, x0:x1]
+        roi_w, roi_h = x1 - x0, y1 - y0
+
+        # Same inverse warp, shifted into ROI coordinates
+        IM[:, 2] -= (x0, y0)
+
+        img_white = np.full((size, size), 255, dtype=np.float32)
+        bgr_fake = cv2.warpAffine(bgr_fake, IM, (roi_w, roi_h), borderValue=0.0)
+        img_mask = cv2.warpAffine(img_white, IM, (roi_w, roi_h), borderValue=0.0)
+        img_mask[img_mask > 20] = 255
+
+        mask_h_inds, mask_w_inds = np.where(img_mask == 255)
+        if len(mask_h_inds) == 0:
+            return img
+        mask_h = np.max(mask_h_inds) - np.min(mask_h_inds)
+        mask_w = np.max(mask_w_inds) - np.min(mask_w_inds)
+        mask_size = int(np.sqrt(mask_h * mask_w))
+
+        k = max(mask_size // 10, 10)
+        img_mask = cv2.erode(img_mask, np.ones((k, k), np.uint8), iterations=1)
+        k = max(mask_size // 20, 5)
+        img_mask = cv2.GaussianBlur(img_mask, (2 * k + 1, 2 * k + 1), 0)
+        img_mask /= 255
+        img_mask = np.reshape(img_mask, [roi_h, roi_w, 1])
+
+        fake_merged = img_mask * bgr_fake + (1 - img_mask) * roi.astype(np.float32)
+        roi[:] = fake_merged.astype(np.uint8)
+        return img
+
+    def swap(self, source_path, target_path, output_path):
+        print("Reading images...")
+
+        tgt_img = cv2.imread(target_path)
 
         if tgt_img is None:
             print("Cannot load target image.")
@@ -67,41 +203,30 @@ class FaceSwapPipeline:
 
         print("Detecting faces...")
 
-        src_faces = self.app.get(src_img)
-        tgt_faces = self.app.get(tgt_img)
-
-        if len(src_faces) == 0:
-            print("No face detected in source image.")
+        src_embedding = self.source_embedding(source_path)
+        if src_embedding is None:
             return False
 
+        tgt_faces = self.app.get(tgt_img)
+
         if len(tgt_faces) == 0:
             print("No face detected in target image.")
             return False
 
-        print(f"Source faces detected: {len(src_faces)}")
         print(f"Target faces detected: {len(tgt_faces)}")
 
-        # Use first source face
-        src_face = src_faces[0]
-
-        result = tgt_img.copy()
-
-        # Swap onto all detected faces in target
-        for i, tgt_face in enumerate(tgt_faces):
-            print(f"Swapping face {i + 1}...")
-            result = self.swapper.get(
-                result,
-                tgt_face,
-                src_face,
-                paste_back=True
-            )
+        # Swap all detected faces in target in one inswapper pass (crops are
+        # taken up front), then paste each straight into tgt_img - no frame copy
+        print(f"Swapping {len(tgt_faces)} face(s)...")
+        for bgr_fake, M in self._swap_faces(tgt_img, tgt_faces, src_embedding):
+            self._paste_back(tgt_img, bgr_fake, M)
 
         # Ensure output directory exists
         output_dir = os.path.dirname(output_path)
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
 
-        cv2.imwrite(output_path, result)
+        cv2.imwrite(output_path, tgt_img)
 
         print("\nSUCCESS")
         print(f"Saved to: {output_path}")
@@ -116,12 +241,17 @@ def main():
     parser.add_argument("--target", required=True, help="Path to target template image")
     parser.add_argument("--output", required=True, help="Path to save result image")
     parser.add_argument("--cpu", action="store_true", help="Force CPU mode")
+    parser.add_argument("--warm-source", action="append", default=[], metavar="PATH",
+                        help="Source image to embed at startup (repeatable)")
     args = parser.parse_args()
 
     use_gpu = not args.cpu
 
     pipeline = FaceSwapPipeline(use_gpu=use_gpu)
 
+    for path in args.warm_source:
+        pipeline.source_embedding(path)
+
     success = pipeline.swap(args.source, args.target, args.output)
 
     if not success:
@@ -5,6 +5,25 @@ import onnxruntime
 import sys
 import os
 import argparse
+import multiprocessing
+import tempfile
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# TensorRT is optional: when present (and a GPU is requested) both models run
+# as FP16 engines instead of through ONNX Runtime.
+try:
+    import tensorrt as trt
+    import pycuda.driver as cuda
+except ImportError:
+    trt = None
+    cuda = None
+
+# Numba is optional: it fuses the blob preprocessing into a single parallel pass
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
 
 # --------------------------------------------------------------------------------
 # RE-IMPLEMENTATION OF ROOP / INSIGHTFACE CORE LOGIC (Raw ONNX Runtime)
@@ -20,6 +39,19 @@ ARC_FACE_DST = np.array([
     [70.7299, 92.2041]
 ], dtype=np.float32)
 
+# Static I/O shapes (batch of one) for the TensorRT profiles and bound buffers
+ARCFACE_INPUT_SHAPES = [(1, 3, 112, 112)]
+INSWAPPER_INPUT_SHAPES = [(1, 3, 128, 128), (1, 512)]
+ARCFACE_OUTPUT_SHAPES = [(1, 512)]
+INSWAPPER_OUTPUT_SHAPES = [(1, 3, 128, 128)]
+
+# 3x3 unsharp mask: 1.5 * img - 0.5 * (mean of the 8 neighbours)
+SHARPEN_KERNEL = np.full((3, 3), -0.5 / 8, dtype=np.float32)
+SHARPEN_KERNEL[1, 1] = 1.5
+
+# Number of source embeddings kept in memory (keyed by path + mtime)
+EMBEDDING_CACHE_SIZE = 64
+
 # Using MediaPipe for robustness since InsightFace detector is hard to install
 try:
     import mediapipe as mp
@@ -27,34 +59,405 @@ except ImportError:
     print("MediaPipe required. pip install mediapipe")
     sys.exit(1)
 
+def similarity_transform(src, dst):
+    """Least-squares 2D similarity (Umeyama) mapping src points onto dst, as a 2x3 matrix."""
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    src_mean = src.mean(axis=0)
+    dst_mean = dst.mean(axis=0)
+    src_c = src - src_mean
+    dst_c = dst - dst_mean
+
+    U, S, Vt = np.linalg.svd(src_c.T @ dst_c)
+    # Reflection fix: force a proper rotation
+    if np.linalg.det(Vt.T @ U.T) < 0:
+        Vt[-1] *= -1
+        S[-1] *= -1
+    R = Vt.T @ U.T
+
+    scale = S.sum() / (src_c ** 2).sum()
+    M = np.empty((2, 3), dtype=np.float64)
+    M[:, :2] = scale * R
+    M[:, 2] = dst_mean - scale * R @ src_mean
+    return M
+
+# --------------------------------------------------------------------------------
+# FUSED KERNELS (shape-specialized, one memory sweep each)
+# --------------------------------------------------------------------------------
+# With numba these are compiled eagerly for the exact C-contiguous layouts used
+# below and cached on disk, so later processes load them instead of re-JITting.
+
+if njit is not None:
+    _KERNEL_OPTS = dict(parallel=True, fastmath=True, boundscheck=False, cache=True)
+
+    @njit("void(uint8[:, :, ::1], float32[:, :, :, ::1], float32, float32)", **_KERNEL_OPTS)
+    def _preprocess(bgr, out, mean, scale):
+        # BGR->RGB, HWC->CHW, float cast and normalize
+        h, w = bgr.shape[0], bgr.shape[1]
+        for y in prange(h):
+            for x in range(w):
+                out[0, 2, y, x] = (bgr[y, x, 0] - mean) * scale
+                out[0, 1, y, x] = (bgr[y, x, 1] - mean) * scale
+                out[0, 0, y, x] = (bgr[y, x, 2] - mean) * scale
+
+    @njit("void(uint8[:, :, ::1], float32[::1], float32[::1], float32[::1], uint8[:, :, ::1])", **_KERNEL_OPTS)
+    def _color_affine(src, s_mean, gain, t_mean, out):
+        # out = clip((src - s_mean) * gain + t_mean, 0, 255) per channel; centered first so
+        # a huge gain (near-constant source channel) can't cancel against the offset
+        h, w = src.shape[0], src.shape[1]
+        for y in prange(h):
+            for x in range(w):
+                for c in range(3):
+                    v = (src[y, x, c] - s_mean[c]) * gain[c] + t_mean[c]
+                    out[y, x, c] = np.uint8(min(max(v, 0.0), 255.0))
+
+    @njit("void(uint8[:, :, ::1], uint8[:, :, ::1], float32[:, ::1], uint8[:, :, ::1])", **_KERNEL_OPTS)
+    def _blend(face, target, mask, out):
+        # out = face * mask + target * (1 - mask), rounded
+        h, w = target.shape[0], target.shape[1]
+        for y in prange(h):
+            for x in range(w):
+                m = mask[y, x]
+                if m <= 0.0:
+                    for c in range(3):
+                        out[y, x, c] = target[y, x, c]
+                else:
+                    for c in range(3):
+                        out[y, x, c] = np.uint8(face[y, x, c] * m + target[y, x, c] * (1.0 - m) + 0.5)
+else:
+    def _preprocess(bgr, out, mean, scale):
+        # Channel flip + transpose are views; the cast/normalize is one pass into out
+        np.subtract(bgr[:, :, ::-1].transpose(2, 0, 1), mean, out=out[0], dtype=np.float32)
+        out *= scale
+
+    def _color_affine(src, s_mean, gain, t_mean, out):
+        res = np.subtract(src, s_mean, dtype=np.float32)
+        res *= gain
+        res += t_mean
+        np.clip(res, 0, 255, out=res)
+        out[...] = res
+
+    def _blend(face, target, mask, out):
+        cv2.blendLinear(face, target, mask, 1.0 - mask, dst=out)
+
+def preprocess_arcface(bgr, out):
+    """112x112 BGR uint8 -> (1,3,112,112) RGB float32 in [-1, 1], written into out."""
+    _preprocess(np.ascontiguousarray(bgr), out, 127.5, 1.0 / 128.0)
+
+def preprocess_inswapper(bgr, out):
+    """128x128 BGR uint8 -> (1,3,128,128) RGB float32 in [0, 1], written into out."""
+    _preprocess(np.ascontiguousarray(bgr), out, 0.0, 1.0 / 255.0)
+
+def _is_url(path):
+    return path.startswith(("http://", "https://"))
+
+def read_image(path):
+    """cv2.imread that also accepts http(s) URLs. Returns None if the image can't be loaded."""
+    if not _is_url(path):
+        return cv2.imread(path)
+    import requests
+    try:
+        response = requests.get(path, timeout=30)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"Cannot fetch {path}: {e}")
+        return None
+    return cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+
+def _model_variant(model_path, suffix):
+    """Path of a generated variant (e.g. `_fp16`) of an ONNX model, or the original if absent."""
+    variant = os.path.splitext(model_path)[0] + f"_{suffix}.onnx"
+    return variant if os.path.exists(variant) else model_path
+
+TensorInfo = namedtuple("TensorInfo", ["name", "shape"])
+
+def _build_or_load_engine(onnx_path, input_shapes):
+    """Load a cached FP16 TensorRT engine for this GPU arch, building it on first use."""
+    import pycuda.autoinit  # noqa: F401 (creates the CUDA context lazily)
+
+    # Engines are only valid for the GPU arch and TensorRT version that built them
+    major, minor = cuda.Device(0).compute_capability()
+    name = os.path.splitext(os.path.basename(onnx_path))[0]
+    engine_path = os.path.join(
+        os.path.dirname(onnx_path), f"{name}_sm{major}{minor}_trt{trt.__version__}_fp16.engine"
+    )
+
+    logger = trt.Logger(trt.Logger.WARNING)
+    runtime = trt.Runtime(logger)
+
+    if os.path.exists(engine_path):
+        with open(engine_path, "rb") as f:
+            engine = runtime.deserialize_cuda_engine(f.read())
+        if engine is not None:
+            return runtime, engine
+        print(f"Cached engine {os.path.basename(engine_path)} is unusable, rebuilding...")
+        try:
+            os.remove(engine_path)
+        except FileNotFoundError:
+            pass
+
+    print(f"Building TensorRT engine for {os.path.basename(onnx_path)} (one-time)...")
+    builder = trt.Builder(logger)
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, logger)
+    with open(onnx_path, "rb") as f:
+        if not parser.parse(f.read()):
+            errors = "\n".join(str(parser.get_error(i)) for i in range(parser.num_errors))
+            raise RuntimeError(f"Failed to parse {onnx_path}:\n{errors}")
+
+    config = builder.create_builder_config()
+    config.set_flag(trt.BuilderFlag.FP16)
+
+    # Static profile: min == opt == max
+    profile = builder.create_optimization_profile()
+    for i, shape in enumerate(input_shapes):
+        profile.set_shape(network.get_input(i).name, shape, shape, shape)
+    config.add_optimization_profile(profile)
+
+    serialized = builder.build_serialized_network(network, config)
+    if serialized is None:
+        raise RuntimeError(f"TensorRT build failed for {onnx_path}")
+
+    # Write to a temp file and rename, so an interrupted build or a concurrent
+    # writer never leaves a truncated engine at engine_path
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(engine_path), suffix=".engine.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(serialized)
+        os.replace(tmp_path, engine_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    engine = runtime.deserialize_cuda_engine(serialized)
+    if engine is None:
+        raise RuntimeError(f"TensorRT could not deserialize the engine built for {onnx_path}")
+    return runtime, engine
+
+class TRTSession:
+    """Drop-in for the parts of onnxruntime.InferenceSession that RoopCore uses."""
+
+    def __init__(self, onnx_path, input_shapes):
+        self.runtime, self.engine = _build_or_load_engine(onnx_path, input_shapes)
+        self.context = self.engine.create_execution_context()
+        self.stream = cuda.Stream()
+
+        names = [self.engine.get_tensor_name(i) for i in range(self.engine.num_io_tensors)]
+        self.input_names = [n for n in names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.INPUT]
+        self.output_names = [n for n in names if n not in self.input_names]
+        for name, shape in zip(self.input_names, input_shapes):
+            self.context.set_input_shape(name, shape)
+
+        # Pinned host + device buffer per tensor, allocated once and bound for every run
+        self.shapes = {}
+        self.host = {}
+        self.device = {}
+        for name in names:
+            self.shapes[name] = tuple(self.context.get_tensor_shape(name))
+            dtype = np.dtype(trt.nptype(self.engine.get_tensor_dtype(name)))
+            self.host[name] = cuda.pagelocked_empty(self.shapes[name], dtype)
+            self.device[name] = cuda.mem_alloc(self.host[name].nbytes)
+            self.context.set_tensor_address(name, int(self.device[name]))
+
+    def get_inputs(self):
+        return [TensorInfo(n, self.shapes[n]) for n in self.input_names]
+
+    def get_outputs(self):
+        return [TensorInfo(n, self.shapes[n]) for n in self.output_names]
+
+    def input_buffer(self, name):
+        """Host array for `name`; filling it in place skips the copy in run()."""
+        return self.host[name]
+
+    def run(self, output_names, feed):
+        """Returned arrays are reused by the next run(); copy them to keep results."""
+        for name, arr in feed.items():
+            if arr is not self.host[name]:
+                np.copyto(self.host[name], arr)
+            cuda.memcpy_htod_async(self.device[name], self.host[name], self.stream)
+
+        self.context.execute_async_v3(self.stream.handle)
+
+        output_names = output_names or self.output_names
+        for name in output_names:
+            cuda.memcpy_dtoh_async(self.host[name], self.device[name], self.stream)
+        self.stream.synchronize()
+        return [self.host[n] for n in output_names]
+
+class ORTSession:
+    """onnxruntime.InferenceSession run through an IoBinding onto preallocated buffers."""
+
+    def __init__(self, model_path, providers, input_shapes, output_shapes, sess_options=None):
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=sess_options, providers=providers)
+        self.on_cuda = "CUDAExecutionProvider" in self.session.get_providers()
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.output_names = [o.name for o in self.session.get_outputs()]
+
+        # On CPU the OrtValues wrap the host arrays directly (zero copy); on
+        # CUDA they are fixed device tensors refreshed from the host arrays.
+        self.host = {}
+        self.device = {}
+        shapes = zip(self.input_names + self.output_names, list(input_shapes) + list(output_shapes))
+        for name, shape in shapes:
+            self.host[name] = np.empty(shape, dtype=np.float32)
+            if self.on_cuda:
+                self.device[name] = onnxruntime.OrtValue.ortvalue_from_shape_and_type(shape, np.float32, "cuda", 0)
+            else:
+                self.device[name] = onnxruntime.OrtValue.ortvalue_from_numpy(self.host[name])
+
+        self.binding = self.session.io_binding()
+        for name in self.input_names:
+            self.binding.bind_ortvalue_input(name, self.device[name])
+        for name in self.output_names:
+            self.binding.bind_ortvalue_output(name, self.device[name])
+
+    def get_inputs(self):
+        return self.session.get_inputs()
+
+    def get_outputs(self):
+        return self.session.get_outputs()
+
+    def input_buffer(self, name):
+        """Host array for `name`; filling it in place skips the copy in run()."""
+        return self.host[name]
+
+    def run(self, output_names, feed):
+        """Returned arrays are reused by the next run(); copy them to keep results."""
+        for name, arr in feed.items():
+            if arr is not self.host[name]:
+                np.copyto(self.host[name], arr)
+            if self.on_cuda:
+                self.device[name].update_inplace(self.host[name])
+
+        self.session.run_with_iobinding(self.binding)
+
+        output_names = output_names or self.output_names
+        if self.on_cuda:
+            for name in output_names:
+                np.copyto(self.host[name], self.device[name].numpy())
+        return [self.host[n] for n in output_names]
+
 class RoopCore:
-    def __init__(self, use_gpu=False):
-        providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if use_gpu else ['CPUExecutionProvider']
+    def __init__(self, use_gpu=False, low_memory=False, video=False, threads=None, int8=False):
+        # HEURISTIC caps cuDNN's per-shape conv algorithm search on the first run
+        cuda_provider = ('CUDAExecutionProvider', {'cudnn_conv_algo_search': 'HEURISTIC'})
+        providers = [cuda_provider, 'CPUExecutionProvider'] if use_gpu else ['CPUExecutionProvider']
+        
+        # Shared session options: full graph fusion, one sized intra-op pool per
+        # session, and no spin-waiting so the idle session's threads don't fight
+        # the running one (the two models always run back to back).
+        so = onnxruntime.SessionOptions()
+        so.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        so.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        so.intra_op_num_threads = threads or max(1, (os.cpu_count() or 2) // 2)
+        so.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        if low_memory:
+            so.enable_cpu_mem_arena = False
         
         script_dir = os.path.dirname(os.path.abspath(__file__))
         self.arcface_path = os.path.join(script_dir, "models", "w600k_r50.onnx")
         self.inswapper_path = os.path.join(script_dir, "models", "inswapper_128.onnx")
 
-        # Load models
+        # Load models (TensorRT FP16 engines when available, else ONNX Runtime)
+        use_trt = use_gpu and trt is not None
+        arcface_model = self.arcface_path
+        inswapper_model = self.inswapper_path
+        if use_gpu and not use_trt and 'CUDAExecutionProvider' in onnxruntime.get_available_providers():
+            # FP16 copies from `setup_models.py --fp16`; TensorRT builds its own FP16 engines
+            arcface_model = _model_variant(self.arcface_path, "fp16")
+            inswapper_model = _model_variant(self.inswapper_path, "fp16")
+        elif int8 and not use_gpu:
+            # Static QDQ INT8 ArcFace from `setup_models.py --int8` (INT8 conv kernels on CPU)
+            arcface_model = _model_variant(self.arcface_path, "int8_qdq")
         print("Loading ArcFace (Analysis)...")
-        self.arcface = onnxruntime.InferenceSession(self.arcface_path, providers=providers)
+        if use_trt:
+            self.arcface = TRTSession(self.arcface_path, ARCFACE_INPUT_SHAPES)
+        else:
+            self.arcface = ORTSession(arcface_model, providers, ARCFACE_INPUT_SHAPES, ARCFACE_OUTPUT_SHAPES, so)
         print("Loading Inswapper (Swap)...")
-        self.inswapper = onnxruntime.InferenceSession(self.inswapper_path, providers=providers)
-
-        # MediaPipe Detection Setup
-        base_options = mp.tasks.BaseOptions(model_asset_path=os.path.join(script_dir, "models", "face_landmarker.task"))
-        options = mp.tasks.vision.FaceLandmarkerOptions(
-            base_options=base_options,
-            running_mode=mp.tasks.vision.RunningMode.IMAGE,
-            num_faces=1
-        )
-        self.detector = mp.tasks.vision.FaceLandmarker.create_from_options(options)
-
-    def get_landmarks(self, img_bgr):
-        """Standard MediaPipe to 5-point conversion."""
+        if use_trt:
+            self.inswapper = TRTSession(self.inswapper_path, INSWAPPER_INPUT_SHAPES)
+        else:
+            self.inswapper = ORTSession(inswapper_model, providers, INSWAPPER_INPUT_SHAPES, INSWAPPER_OUTPUT_SHAPES, so)
+
+        # Reusable input buffers (pinned on the TensorRT path)
+        self._arcface_input = self.arcface.get_inputs()[0].name
+        self._swap_target_input = self.inswapper.get_inputs()[0].name
+        self._swap_source_input = self.inswapper.get_inputs()[1].name
+        self._h_in112 = self.arcface.input_buffer(self._arcface_input)
+        self._h_in128 = self.inswapper.input_buffer(self._swap_target_input)
+        self._h_latent = self.inswapper.input_buffer(self._swap_source_input)
+
+        self._embedding_cache = OrderedDict()
+
+        # Standard Square Mask logic (InsightFace native), fixed for the 128x128 crop
+        mask = np.full((128, 128), 255, dtype=np.uint8)
+        cv2.rectangle(mask, (0, 0), (128, 128), 0, 10) # Black border to remove artifacts
+        mask = cv2.GaussianBlur(mask, (15, 15), 0)
+        self._paste_mask = mask.astype(np.float32) * (1.0 / 255.0)
+
+        # MediaPipe Detection Setup (GPU delegate with the GPU pipeline). In video mode
+        # target frames go through a VIDEO-mode landmarker that tracks the face across
+        # consecutive frames; source selfies always use an IMAGE-mode one so they
+        # never enter (or seed) that tracked stream.
+        self.video = video
+        self._frame_ts = 0
+        Delegate = mp.tasks.BaseOptions.Delegate
+        RunningMode = mp.tasks.vision.RunningMode
+
+        def make_detector(delegate, running_mode):
+            base_options = mp.tasks.BaseOptions(
+                model_asset_path=os.path.join(script_dir, "models", "face_landmarker.task"),
+                delegate=delegate
+            )
+            options = mp.tasks.vision.FaceLandmarkerOptions(
+                base_options=base_options,
+                running_mode=running_mode,
+                num_faces=1
+            )
+            return mp.tasks.vision.FaceLandmarker.create_from_options(options)
+
+        delegate = Delegate.CPU
+        if use_gpu:
+            try:
+                self.detector = make_detector(Delegate.GPU, RunningMode.IMAGE)
+                delegate = Delegate.GPU
+            except (RuntimeError, NotImplementedError) as e:
+                # GPU delegate is unavailable on some platforms (e.g. Windows)
+                print(f"MediaPipe GPU delegate unavailable ({e}), using CPU.")
+        if delegate == Delegate.CPU:
+            self.detector = make_detector(Delegate.CPU, RunningMode.IMAGE)
+        self.video_detector = make_detector(delegate, RunningMode.VIDEO) if video else None
+
+        # Pay the CUDA warm-up (cuDNN algo search, allocator growth) here, not on the first swap()
+        if use_gpu:
+            self._warmup()
+
+    def _warmup(self, runs=2):
+        """Run both models on zero inputs."""
+        self._h_in112.fill(0)
+        self._h_in128.fill(0)
+        self._h_latent.fill(0)
+        for _ in range(runs):
+            self.arcface.run(None, {self._arcface_input: self._h_in112})
+            self.inswapper.run(None, {
+                self._swap_target_input: self._h_in128,
+                self._swap_source_input: self._h_latent
+            })
+
+    def get_landmarks(self, img_bgr, tracked=False):
+        """
+        Standard MediaPipe to 5-point conversion. `tracked` marks a target frame,
+        which goes through the VIDEO-mode landmarker when video mode is on.
+        """
         img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
         mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=img_rgb)
-        result = self.detector.detect(mp_image)
+        if tracked and self.video_detector is not None:
+            # VIDEO mode requires strictly increasing timestamps
+            self._frame_ts += 1
+            result = self.video_detector.detect_for_video(mp_image, self._frame_ts)
+        else:
+            result = self.detector.detect(mp_image)
         
         if not result.face_landmarks:
             return None
@@ -70,82 +473,106 @@ class RoopCore:
 
     def norm_crop(self, img, landmark, image_size=112):
         """Standard InsightFace alignment transformation."""
-        M = cv2.estimateAffinePartial2D(landmark, ARC_FACE_DST, method=cv2.LMEDS)[0]
+        M = similarity_transform(landmark, ARC_FACE_DST)
         warped = cv2.warpAffine(img, M, (image_size, image_size), borderValue=0.0)
         return warped, M
 
     def get_embedding(self, face_img):
         """Get 512-D embedding from 112x112 face."""
-        # Preprocess: Transpose, Expand, Normalize (-1 to 1)
-        img = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
-        img = np.transpose(img, (2, 0, 1))
-        img = np.expand_dims(img, axis=0)
-        img = (img.astype(np.float32) - 127.5) / 128.0
+        # Preprocess straight into the input buffer: RGB, CHW, Normalize (-1 to 1)
+        preprocess_arcface(face_img, self._h_in112)
         
-        embed = self.arcface.run(None, {self.arcface.get_inputs()[0].name: img})[0]
-        return embed / np.linalg.norm(embed) # Normalize
+        embed = self.arcface.run(None, {self._arcface_input: self._h_in112})[0]
+        # L2 normalize in one float32 pass (also copies out of the reused buffer)
+        return cv2.normalize(embed.reshape(1, -1), None, norm_type=cv2.NORM_L2).reshape(embed.shape)
 
-    def color_transfer(self, source, target):
-        """Match source face color to target face color using LAB statistics."""
-        # Convert to LAB
-        s_lab = cv2.cvtColor(source, cv2.COLOR_BGR2LAB).astype(np.float32)
-        t_lab = cv2.cvtColor(target, cv2.COLOR_BGR2LAB).astype(np.float32)
+    def source_embedding(self, source_path):
+        """Embedding of the source face, memoized by (path, mtime) or URL. None if no face."""
+        if _is_url(source_path):
+            key = (source_path, None)
+        else:
+            try:
+                key = (os.path.abspath(source_path), os.path.getmtime(source_path))
+            except OSError:
+                print(f"Cannot load source image: {source_path}")
+                return None
+        
+        embed = self._embedding_cache.get(key)
+        if embed is not None:
+            self._embedding_cache.move_to_end(key)
+            return embed
+        
+        source_img = read_image(source_path)
+        if source_img is None:
+            print(f"Cannot load source image: {source_path}")
+            return None
+        
+        src_kps = self.get_landmarks(source_img)
+        if src_kps is None: return None
         
-        # Compute stats
-        s_mean, s_std = cv2.meanStdDev(s_lab)
-        t_mean, t_std = cv2.meanStdDev(t_lab)
+        align_src, _ = self.norm_crop(source_img, src_kps, 112)
+        embed = self.get_embedding(align_src)
+        embed.setflags(write=False)
         
-        s_mean = s_mean.flatten()
-        s_std = s_std.flatten()
-        t_mean = t_mean.flatten()
-        t_std = t_std.flatten()
+        self._embedding_cache[key] = embed
+        if len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+            self._embedding_cache.popitem(last=False)
+        return embed
+
+    def color_transfer(self, source, target):
+        """Match source face color to target face color using YCrCb statistics."""
+        # Convert to YCrCb (linear transform of BGR, unlike LAB's gamma/cube-root LUTs)
+        s_ycc = cv2.cvtColor(source, cv2.COLOR_BGR2YCrCb)
+        t_ycc = cv2.cvtColor(target, cv2.COLOR_BGR2YCrCb)
+        
+        # Compute stats (straight off the uint8 images, as float32 per channel)
+        s_mean, s_std = (v.astype(np.float32).ravel() for v in cv2.meanStdDev(s_ycc))
+        t_mean, t_std = (v.astype(np.float32).ravel() for v in cv2.meanStdDev(t_ycc))
         
         # Avoid zero division
-        s_std = np.clip(s_std, 1e-5, None)
+        gain = t_std / np.maximum(s_std, 1e-5)
         
-        # Transfer
-        for k in range(3):
-            s_lab[:,:,k] = (s_lab[:,:,k] - s_mean[k]) * (t_std[k] / s_std[k]) + t_mean[k]
-            
-        s_lab = np.clip(s_lab, 0, 255).astype(np.uint8)
-        return cv2.cvtColor(s_lab, cv2.COLOR_LAB2BGR)
+        # Transfer: (x - s_mean) * gain + t_mean, fused with the clip + cast
+        out = np.empty_like(s_ycc)
+        _color_affine(s_ycc, s_mean, gain, t_mean, out)
+        return cv2.cvtColor(out, cv2.COLOR_YCrCb2BGR)
 
     def apply_sharpening(self, img):
-        """Apply unsharp mask to enhance details."""
-        gaussian = cv2.GaussianBlur(img, (0, 0), 2.0)
-        unsharp = cv2.addWeighted(img, 1.5, gaussian, -0.5, 0)
-        return np.clip(unsharp, 0, 255).astype(np.uint8)
+        """Apply unsharp mask to enhance details (single uint8 -> uint8 filter pass)."""
+        return cv2.filter2D(img, -1, SHARPEN_KERNEL, borderType=cv2.BORDER_REPLICATE)
 
     def swap(self, source_path, target_path, output_path):
-        source_img = cv2.imread(source_path)
-        target_img = cv2.imread(target_path)
-        
-        # 1. Source Embedding
-        src_kps = self.get_landmarks(source_img)
-        if src_kps is None: return False
-        
-        align_src, _ = self.norm_crop(source_img, src_kps, 112)
-        source_embed = self.get_embedding(align_src)
+        # Read the target in the background while the source is read + embedded (or hits the cache);
+        # the executor is per call so no reader thread outlives it
+        with ThreadPoolExecutor(max_workers=1) as io_pool:
+            target_future = io_pool.submit(read_image, target_path)
+
+            # 1. Source Embedding (cached across calls with the same source file)
+            source_embed = self.source_embedding(source_path)
+            target_img = target_future.result()
+        if source_embed is None: return False
+        if target_img is None:
+            print(f"Cannot load target image: {target_path}")
+            return False
         
         # 2. Target Alignment (Roop style uses 128x128 for inswapper)
-        tgt_kps = self.get_landmarks(target_img)
+        tgt_kps = self.get_landmarks(target_img, tracked=True)
         if tgt_kps is None: return False
         
         # Scale affine matrix for 128x128
         dst_128 = ARC_FACE_DST * (128.0 / 112.0)
-        M_128 = cv2.estimateAffinePartial2D(tgt_kps, dst_128, method=cv2.LMEDS)[0]
+        M_128 = similarity_transform(tgt_kps, dst_128)
         
         align_tgt = cv2.warpAffine(target_img, M_128, (128, 128), borderValue=0.0)
         
         # 3. Predict Swap
-        blob = cv2.cvtColor(align_tgt, cv2.COLOR_BGR2RGB)
-        blob = np.transpose(blob, (2, 0, 1))
-        blob = np.expand_dims(blob, axis=0).astype(np.float32) / 255.0
+        preprocess_inswapper(align_tgt, self._h_in128)
+        np.copyto(self._h_latent, source_embed)
         
         # Inswapper inputs
         feed = {
-            self.inswapper.get_inputs()[0].name: blob,
-            self.inswapper.get_inputs()[1].name: source_embed
+            self._swap_target_input: self._h_in128,
+            self._swap_source_input: self._h_latent
         }
         res_blob = self.inswapper.run(None, feed)[0]
         
@@ -164,30 +591,92 @@ class RoopCore:
         h, w = target_img.shape[:2]
         inv_M = cv2.invertAffineTransform(M_128)
         
-        # Standard Square Mask logic (InsightFace native)
-        mask = np.full((128, 128), 255, dtype=np.uint8)
-        cv2.rectangle(mask, (0, 0), (128, 128), 0, 10) # Black border to remove artifacts
-        mask = cv2.GaussianBlur(mask, (15, 15), 0)
+        # Warp face into a preallocated frame buffer and the mask as float weights
+        warped_face = np.empty_like(target_img)
+        cv2.warpAffine(swapped, inv_M, (w, h), dst=warped_face, flags=cv2.INTER_LINEAR)
+        mask_f = cv2.warpAffine(self._paste_mask, inv_M, (w, h))
         
-        warped_face = cv2.warpAffine(swapped, inv_M, (w, h))
-        warped_mask = cv2.warpAffine(mask, inv_M, (w, h))
-        
-        # Blend
-        mask_f = warped_mask.astype(np.float32) / 255.0
-        mask_f = np.expand_dims(mask_f, axis=2)
-        
-        final = (warped_face * mask_f + target_img * (1.0 - mask_f)).astype(np.uint8)
+        # Blend: single fused per-pixel multiply-add
+        final = np.empty_like(target_img)
+        _blend(warped_face, target_img, mask_f, final)
         
         cv2.imwrite(output_path, final)
         print(f"Saved: {output_path}")
         return True
 
+# --------------------------------------------------------------------------------
+# MULTI-PROCESS FRAME SWAPPING (batch / video)
+# --------------------------------------------------------------------------------
+
+# Per-process state set up by the pool initializer
+_worker_core = None
+_worker_source = None
+
+def _init_worker(source_path, use_gpu, low_memory, threads, int8):
+    """Build this process's own RoopCore (sessions, pinned buffers, CUDA context)."""
+    global _worker_core, _worker_source
+    if njit is not None:
+        import numba
+        numba.set_num_threads(threads)
+    _worker_core = RoopCore(use_gpu=use_gpu, low_memory=low_memory, video=True, threads=threads, int8=int8)
+    _worker_source = source_path
+    _worker_core.source_embedding(source_path)
+
+def _swap_frame(job):
+    target_path, output_path = job
+    return _worker_core.swap(_worker_source, target_path, output_path)
+
+def run_video(source_path, frame_paths, output_dir, workers=4, use_gpu=False, low_memory=False, int8=False):
+    """
+    Swap the source face onto every frame in `frame_paths` across `workers` processes,
+    writing each result to output_dir under the frame's file name (names must be unique,
+    else ValueError). Returns the number of frames swapped.
+    """
+    jobs = [(path, os.path.join(output_dir, os.path.basename(path))) for path in frame_paths]
+    # Same-named frames from different directories would overwrite each other's output
+    seen = {}
+    for path, output_path in jobs:
+        if output_path in seen:
+            raise ValueError(f"{path} and {seen[output_path]} would both be written to {output_path}")
+        seen[output_path] = path
+    os.makedirs(output_dir, exist_ok=True)
+
+    if use_gpu and trt is not None:
+        # Build missing engines once here so the workers only deserialize the cached files
+        models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+        _build_or_load_engine(os.path.join(models_dir, "w600k_r50.onnx"), ARCFACE_INPUT_SHAPES)
+        _build_or_load_engine(os.path.join(models_dir, "inswapper_128.onnx"), INSWAPPER_INPUT_SHAPES)
+
+    # Split the CPU between workers instead of every worker sizing its pools to the whole machine
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # One contiguous slice per worker keeps consecutive frames together for MediaPipe's VIDEO tracking
+    chunksize = max(1, -(-len(jobs) // workers))
+
+    # spawn, not fork: a forked child must not inherit the parent's CUDA/ORT state
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(source_path, use_gpu, low_memory, threads, int8)) as pool:
+        results = pool.map(_swap_frame, jobs, chunksize=chunksize)
+    return sum(results)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--source", required=True)
-    parser.add_argument("--target", required=True)
-    parser.add_argument("--output", required=True)
+    parser.add_argument("--target", required=True, nargs="+", help="Target image, or several frames")
+    parser.add_argument("--output", required=True, help="Output image (a directory when several targets are given)")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes for multiple targets")
+    parser.add_argument("--gpu", action="store_true", help="Use CUDA / TensorRT")
+    parser.add_argument("--low-memory", action="store_true", help="Disable the ONNX Runtime CPU memory arena")
+    parser.add_argument("--int8", action="store_true", help="Use the INT8 ArcFace from `setup_models.py --int8` (CPU only)")
+    parser.add_argument("--warm-source", action="append", default=[], metavar="PATH",
+                        help="Source image to embed at startup (repeatable)")
     args = parser.parse_args()
     
-    roop = RoopCore()
-    roop.swap(args.source, args.target, args.output)
+    if len(args.target) > 1:
+        done = run_video(args.source, args.target, args.output, workers=args.workers,
+                         use_gpu=args.gpu, low_memory=args.low_memory, int8=args.int8)
+        print(f"Swapped {done}/{len(args.target)} frames into {args.output}")
+    else:
+        roop = RoopCore(use_gpu=args.gpu, low_memory=args.low_memory, int8=args.int8)
+        for path in args.warm_source:
+            roop.source_embedding(path)
+        roop.swap(args.source, args.target[0], args.output)
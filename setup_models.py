@@ -1,6 +1,10 @@
 import os
+import re
 import requests
 import sys
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
 
@@ -9,32 +13,145 @@ MODELS = {
     "w600k_r50.onnx": "https://huggingface.co/ezioruan/inswapper_128.onnx/resolve/main/w600k_r50.onnx"
 }
 
+# Stream in 1 MiB chunks (far fewer read/write calls than 8 KiB)
+CHUNK_SIZE = 1 << 20
+
 def download_file(url, filepath):
     if os.path.exists(filepath):
         print(f"✅ {os.path.basename(filepath)} already exists.")
         return
 
-    print(f"⬇️ Downloading {os.path.basename(filepath)}...")
+    # Download into a .part file and resume it with a Range request after a failure
+    part_path = filepath + ".part"
+    resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={resume_from}-"} if resume_from else {}
+
+    print(f"⬇️ Downloading {os.path.basename(filepath)}{' (resuming)' if resume_from else ''}...")
     try:
-        response = requests.get(url, stream=True)
+        response = requests.get(url, stream=True, timeout=30, headers=headers)
+        if response.status_code == 416:
+            # Range not satisfiable: the partial file is complete only if it matches the
+            # remote size (Content-Range: bytes */<total>); otherwise start over
+            match = re.match(r"bytes \*/(\d+)", response.headers.get("Content-Range", ""))
+            if match and int(match.group(1)) == os.path.getsize(part_path):
+                os.replace(part_path, filepath)
+                print(f"✅ Downloaded {os.path.basename(filepath)}")
+                return
+            print(f"⚠️ Partial {os.path.basename(filepath)} doesn't match the remote file, restarting...")
+            os.remove(part_path)
+            return download_file(url, filepath)
         response.raise_for_status()
-        total_size = int(response.headers.get('content-length', 0))
-        
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
+
+        # 206 = server honoured the Range header; anything else restarts from scratch
+        mode = 'ab' if response.status_code == 206 else 'wb'
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
                 if chunk:
                     f.write(chunk)
+        os.replace(part_path, filepath)
         print(f"✅ Downloaded {os.path.basename(filepath)}")
     except Exception as e:
         print(f"❌ Failed to download {os.path.basename(filepath)}: {e}")
-        if os.path.exists(filepath):
-            os.remove(filepath)
+
+def convert_fp16(filepath):
+    """Write an FP16 copy of an ONNX model next to it (inputs/outputs stay FP32)."""
+    fp16_path = os.path.splitext(filepath)[0] + "_fp16.onnx"
+    if os.path.exists(fp16_path):
+        print(f"✅ {os.path.basename(fp16_path)} already exists.")
+        return
+    if not os.path.exists(filepath):
+        return
+
+    try:
+        import onnx
+        from onnxconverter_common import float16
+    except ImportError:
+        print("❌ FP16 conversion requires: pip install onnx onnxconverter-common")
+        return
+
+    print(f"🔧 Converting {os.path.basename(filepath)} to FP16...")
+    model = onnx.load(filepath)
+    model_fp16 = float16.convert_float_to_float16(model, keep_io_types=True)
+    onnx.save(model_fp16, fp16_path)
+    print(f"✅ Saved {os.path.basename(fp16_path)}")
+
+def quantize_int8(filepath, calib_dir):
+    """
+    Write a static INT8 (QDQ) copy of the ArcFace model next to it, calibrated on
+    the faces found in the images under calib_dir. Dynamic quantization is not an
+    option here: it turns every Conv into ConvInteger, which is slower than FP32 on CPU.
+    """
+    int8_path = os.path.splitext(filepath)[0] + "_int8_qdq.onnx"
+    if os.path.exists(int8_path):
+        print(f"✅ {os.path.basename(int8_path)} already exists.")
+        return
+    if not os.path.exists(filepath):
+        return
+
+    try:
+        import numpy as np
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        from face_swap_ml import RoopCore, preprocess_arcface, read_image, ARCFACE_INPUT_SHAPES
+    except ImportError:
+        print("❌ INT8 quantization requires: pip install onnxruntime onnx (and requirements.txt)")
+        return
+
+    # Calibration inputs: aligned 112x112 faces, preprocessed exactly as RoopCore.get_embedding does
+    core = RoopCore()
+    input_name = core.arcface.get_inputs()[0].name
+    feeds = []
+    for name in sorted(os.listdir(calib_dir)):
+        img = read_image(os.path.join(calib_dir, name))
+        kps = core.get_landmarks(img) if img is not None else None
+        if kps is None:
+            continue
+        face, _ = core.norm_crop(img, kps)
+        blob = np.empty(ARCFACE_INPUT_SHAPES[0], dtype=np.float32)
+        preprocess_arcface(face, blob)
+        feeds.append({input_name: blob})
+    if not feeds:
+        print(f"❌ No faces found in {calib_dir} to calibrate INT8 quantization.")
+        return
+
+    class FaceReader(CalibrationDataReader):
+        def __init__(self):
+            self.feeds = iter(feeds)
+
+        def get_next(self):
+            return next(self.feeds, None)
+
+    print(f"🔧 Quantizing {os.path.basename(filepath)} to INT8 ({len(feeds)} calibration faces)...")
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(filepath)) as tmp:
+        pre_path = os.path.join(tmp, "pre.onnx")
+        out_path = os.path.join(tmp, "int8.onnx")
+        quant_pre_process(filepath, pre_path, skip_symbolic_shape=True)
+        quantize_static(pre_path, out_path, FaceReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        os.replace(out_path, int8_path)
+    print(f"✅ Saved {os.path.basename(int8_path)}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download face swap models")
+    parser.add_argument("--fp16", action="store_true", help="Also write FP16 copies of the models (for GPU)")
+    parser.add_argument("--int8", metavar="DIR",
+                        help="Also write a static INT8 ArcFace for the CPU path, calibrated on the face photos in DIR")
+    args = parser.parse_args()
+
     if not os.path.exists(MODELS_DIR):
         os.makedirs(MODELS_DIR)
 
-    print("🚀 Setting up AI Models...")
-    for name, url in MODELS.items():
+    def setup_model(item):
+        name, url = item
         download_file(url, os.path.join(MODELS_DIR, name))
+        if args.fp16:
+            convert_fp16(os.path.join(MODELS_DIR, name))
+
+    print("🚀 Setting up AI Models...")
+    # Models are independent: fetch them in parallel
+    with ThreadPoolExecutor(max_workers=len(MODELS)) as ex:
+        list(ex.map(setup_model, MODELS.items()))
+    # Calibration runs the full RoopCore pipeline, so it waits for every download
+    if args.int8:
+        quantize_int8(os.path.join(MODELS_DIR, "w600k_r50.onnx"), args.int8)
     print("✨ Model setup complete.")